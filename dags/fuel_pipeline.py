@@ -8,12 +8,15 @@ import sys
 from datetime import datetime, timedelta
 
 from airflow import DAG
+from airflow.decorators import task
 from airflow.operators.python import PythonOperator
 from airflow.operators.empty import EmptyOperator
 
 # Add include path for imports
 sys.path.insert(0, "/usr/local/airflow/include")
 
+from utils.api_client import DEFAULT_CITIES
+
 # =====================
 # DAG Configuration
 # =====================
@@ -31,44 +34,61 @@ default_args = {
 # Task Functions
 # =====================
 
-def extract_to_bronze(**context):
+@task(
+    pool="rapidapi",
+    pool_slots=1,
+    max_active_tis_per_dag=2,
+    priority_weight=10,
+)
+def fetch_city_fuel_data(city):
+    """
+    BRONZE LAYER (fetch): one mapped task instance per city
+    The rapidapi pool plus max_active_tis_per_dag cap concurrent calls
+    to the provider so backfills cannot burst past its rate limit;
+    bronze outranks downstream tasks when worker slots are contended
+    """
+    from utils.api_client import get_fuel_data_for_cities
+
+    api_key = os.getenv("RAPIDAPI_KEY")
+
+    print(f"Fetching fuel data for {city['city_id']}...")
+    results = get_fuel_data_for_cities(api_key, [city])
+    return results[0] if results else None
+
+
+@task
+def load_to_bronze(data, **context):
     """
-    BRONZE LAYER: Extract raw data from API
+    BRONZE LAYER (load): bulk insert the mapped fetch results
     Stores complete API response as JSONB
     """
-    from utils.api_client import get_fuel_data_for_cities, DEFAULT_CITIES
     from utils.db_utils import insert_bronze_data, log_etl_run
-    
-    api_key = os.getenv("RAPIDAPI_KEY")
+
     run_id = context["run_id"]
-    
-    print(f"Fetching fuel data for {len(DEFAULT_CITIES)} cities...")
-    
+    payloads = [item for item in data if item]
+
+    print(f"Loading {len(payloads)} city payloads into bronze layer...")
+
     try:
-        # Fetch data from API
-        data = get_fuel_data_for_cities(api_key, DEFAULT_CITIES)
-        
-        # Insert into bronze table
-        records_count = insert_bronze_data(data)
-        
+        records_count = insert_bronze_data(payloads)
+
         print(f"Inserted {records_count} records into bronze layer")
-        
-        # Log success
+
         log_etl_run(
             run_id=run_id,
             dag_id="fuel_pipeline",
-            task_id="extract_to_bronze",
+            task_id="load_to_bronze",
             layer="bronze",
             records_processed=records_count
         )
-        
+
         return records_count
-        
+
     except Exception as e:
         log_etl_run(
             run_id=run_id,
             dag_id="fuel_pipeline",
-            task_id="extract_to_bronze",
+            task_id="load_to_bronze",
             layer="bronze",
             records_processed=0,
             status="failed",
@@ -77,87 +97,41 @@ def extract_to_bronze(**context):
         raise
 
 
-def transform_to_silver(**context):
+def transform_and_aggregate(**context):
     """
-    SILVER LAYER: Clean and normalize data
-    Flattens nested JSON, creates one row per fuel type
+    SILVER + GOLD LAYERS: Fused transform and aggregation
+    One transaction upserts silver and re-aggregates exactly the
+    (state, day) groups it touched into gold state analytics
     """
-    from utils.db_utils import transform_bronze_to_silver, log_etl_run
-    
+    from utils.db_utils import transform_and_aggregate as run_transform, log_etl_run
+
     run_id = context["run_id"]
-    
-    print("Transforming bronze data to silver layer...")
-    
-    try:
-        records_count = transform_bronze_to_silver()
-        
-        print(f"Transformed {records_count} records to silver layer")
-        
-        log_etl_run(
-            run_id=run_id,
-            dag_id="fuel_pipeline",
-            task_id="transform_to_silver",
-            layer="silver",
-            records_processed=records_count
-        )
-        
-        return records_count
-        
-    except Exception as e:
-        log_etl_run(
-            run_id=run_id,
-            dag_id="fuel_pipeline",
-            task_id="transform_to_silver",
-            layer="silver",
-            records_processed=0,
-            status="failed",
-            error_message=str(e)
-        )
-        raise
 
+    print("Transforming bronze data to silver and gold layers...")
 
-def aggregate_to_gold(**context):
-    """
-    GOLD LAYER: Create analytics-ready aggregations
-    State-level stats and price trends for ML
-    """
-    from utils.db_utils import (
-        aggregate_to_gold_state_analytics,
-        compute_price_trends,
-        log_etl_run
-    )
-    
-    run_id = context["run_id"]
-    
-    print("Aggregating silver data to gold layer...")
-    
     try:
-        # State analytics
-        state_records = aggregate_to_gold_state_analytics()
-        print(f"Created {state_records} state analytics records")
-        
-        # Price trends for ML
-        trend_records = compute_price_trends()
-        print(f"Computed {trend_records} price trend records")
-        
-        total_records = state_records + trend_records
-        
-        log_etl_run(
-            run_id=run_id,
-            dag_id="fuel_pipeline",
-            task_id="aggregate_to_gold",
-            layer="gold",
-            records_processed=total_records
-        )
-        
-        return total_records
-        
+        counts = run_transform()
+
+        print(f"Transformed {counts['silver']} records to silver layer")
+        print(f"Created {counts['gold']} gold layer records")
+
+        for layer in ("silver", "gold"):
+            log_etl_run(
+                run_id=run_id,
+                dag_id="fuel_pipeline",
+                task_id="transform_and_aggregate",
+                layer=layer,
+                records_processed=counts[layer]
+            )
+
+        return counts["silver"] + counts["gold"]
+
     except Exception as e:
         log_etl_run(
             run_id=run_id,
             dag_id="fuel_pipeline",
-            task_id="aggregate_to_gold",
-            layer="gold",
+            task_id="transform_and_aggregate",
+            layer="silver",
             records_processed=0,
             status="failed",
             error_message=str(e)
@@ -205,30 +179,24 @@ with DAG(
     schedule="0 6 * * *",  # Daily at 6 AM (API updates at 6 AM IST)
     start_date=datetime(2025, 1, 1),
     catchup=False,
+    max_active_runs=1,  # Overlapping runs race on the same upsert keys
+    max_active_tasks=4,
     tags=["etl", "fuel", "mlflow"],
 ) as dag:
     
     # Start marker
     start = EmptyOperator(task_id="start")
-    
-    # Bronze: Raw data extraction
-    bronze_task = PythonOperator(
-        task_id="extract_to_bronze",
-        python_callable=extract_to_bronze,
-    )
-    
-    # Silver: Data transformation
-    silver_task = PythonOperator(
-        task_id="transform_to_silver",
-        python_callable=transform_to_silver,
-    )
-    
-    # Gold: Analytics aggregation
-    gold_task = PythonOperator(
-        task_id="aggregate_to_gold",
-        python_callable=aggregate_to_gold,
+
+    # Bronze: one mapped fetch per city, then a single bulk load
+    fetched = fetch_city_fuel_data.expand(city=list(DEFAULT_CITIES))
+    bronze_task = load_to_bronze(fetched)
+
+    # Silver + Gold: fused transformation and aggregation
+    transform_task = PythonOperator(
+        task_id="transform_and_aggregate",
+        python_callable=transform_and_aggregate,
     )
-    
+
     # MLflow: Metric logging
     mlflow_task = PythonOperator(
         task_id="log_to_mlflow",
@@ -239,5 +207,6 @@ with DAG(
     end = EmptyOperator(task_id="end")
     
     # Define task dependencies
-    # start → bronze → silver → gold → mlflow → end
-    start >> bronze_task >> silver_task >> gold_task >> mlflow_task >> end
+    # start → fetch (mapped) → bronze load → silver+gold → mlflow → end
+    start >> fetched
+    bronze_task >> transform_task >> mlflow_task >> end
@@ -1,9 +1,10 @@
 """include/utils/__init__.py"""
-from .api_client import FuelPriceAPI, get_fuel_data_for_cities, DEFAULT_CITIES
+from .api_client import FuelPriceAPI, get_api_client, get_fuel_data_for_cities, DEFAULT_CITIES
 from .db_utils import (
     get_connection,
     insert_bronze_data,
     transform_bronze_to_silver,
+    transform_and_aggregate,
     aggregate_to_gold_state_analytics,
     compute_price_trends,
     log_etl_run,
@@ -1,8 +1,26 @@
 import os
+import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Disk cache for the 30-day history payloads: only the trailing day
+# changes, so history only needs to be fetched once per city per day
+CACHE_DIR = os.getenv(
+    "FUEL_API_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "cache")
+)
+
 
 class FuelPriceAPI:
     """Client for Daily Fuel Prices API"""
@@ -23,18 +41,59 @@ class FuelPriceAPI:
             "x-rapidapi-key": self.api_key,
             "x-rapidapi-host": self.api_host
         }
-    
+
+        # Shared session keeps TLS connections alive across city calls
+        # (one handshake instead of one per request) and retries
+        # transient failures at the transport layer
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"],
+                respect_retry_after_header=True,
+            ),
+        ))
+
+        # Per-instance memoization of the day's history fetches
+        self._cached_history = lru_cache(maxsize=64)(self._fetch_history_for_date)
+
     def _request(self, endpoint: str) -> Dict[str, Any]:
         """Make API request"""
         url = f"{self.BASE_URL}/{endpoint}"
-        response = requests.get(url, headers=self.headers, timeout=30)
+        response = self.session.get(url, timeout=30)
         response.raise_for_status()
+        # orjson parses the raw bytes directly (C SIMD parser), faster
+        # and with lower peak memory than response.json()
+        if orjson is not None:
+            return orjson.loads(response.content)
         return response.json()
-    
+
     def get_city_history(self, state_id: str, city_id: str) -> Dict[str, Any]:
         """API response with history data"""
         endpoint = f"history/india/{state_id}/{city_id}"
         return self._request(endpoint)
+
+    def get_city_history_cached(self, state_id: str, city_id: str) -> Dict[str, Any]:
+        """History response, served from the per-day disk cache when possible"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        return self._cached_history(state_id, city_id, today)
+
+    def _fetch_history_for_date(self, state_id: str, city_id: str, date: str) -> Dict[str, Any]:
+        cache_path = os.path.join(CACHE_DIR, f"history_{state_id}_{city_id}_{date}.json")
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                return json.load(f)
+
+        data = self.get_city_history(state_id, city_id)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w") as f:
+            json.dump(data, f)
+        return data
     
     def get_today_city(self, state_id: str, city_id: str) -> Dict[str, Any]:
         """Get today's prices for a city"""
@@ -52,29 +111,103 @@ class FuelPriceAPI:
         return self._request(endpoint)
 
 
-# Default cities to track
-DEFAULT_CITIES = [
+# Default cities to track (tuple so shared module state stays immutable)
+DEFAULT_CITIES = (
     {"state_id": "maharashtra", "city_id": "mumbai"},
     {"state_id": "delhi", "city_id": "delhi"},
     {"state_id": "karnataka", "city_id": "bengaluru"},
     {"state_id": "tamil-nadu", "city_id": "chennai"},
     {"state_id": "west-bengal", "city_id": "kolkata"},
     {"state_id": "telangana", "city_id": "hyderabad"},
-]
+)
+
+
+# Process-wide client singleton: reuses the Session's warm connections
+# and the per-instance history caches across invocations
+_CLIENT: Optional[FuelPriceAPI] = None
+
+
+def get_api_client(api_key: Optional[str] = None) -> FuelPriceAPI:
+    """Lazily construct and reuse one FuelPriceAPI per process"""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = FuelPriceAPI(api_key=api_key)
+    return _CLIENT
+
+
+def _marker_path(state_id: str, city_id: str) -> str:
+    return os.path.join(CACHE_DIR, f"last_fetch_{state_id}_{city_id}.txt")
+
+
+def _last_fetch_date(state_id: str, city_id: str):
+    """Date of the last successful fetch for this city, or None"""
+    try:
+        with open(_marker_path(state_id, city_id)) as f:
+            return datetime.strptime(f.read().strip(), "%Y-%m-%d").date()
+    except (OSError, ValueError):
+        return None
+
+
+def _record_fetch_date(state_id: str, city_id: str, day) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_marker_path(state_id, city_id), "w") as f:
+        f.write(day.strftime("%Y-%m-%d"))
+
+
+def _as_history_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a today/ response into the history envelope bronze expects"""
+    if "history" in payload:
+        return payload
+    envelope_keys = ("cityId", "cityName", "stateId", "stateName", "countryId")
+    item = {k: v for k, v in payload.items() if k not in envelope_keys}
+    return {
+        **{k: payload.get(k) for k in envelope_keys},
+        "history": [item],
+    }
+
+
+def _fetch_city(client: FuelPriceAPI, state_id: str, city_id: str) -> Dict[str, Any]:
+    """Fetch one city, using the cheap today/ endpoint when history is already ingested"""
+    today = datetime.now().date()
+    last_fetch = _last_fetch_date(state_id, city_id)
+    if last_fetch is not None and (today - last_fetch).days <= 1:
+        # Fetched yesterday (or earlier today), so bronze is current
+        # through then and only today's prices can have changed
+        payload = _as_history_payload(client.get_today_city(state_id, city_id))
+    else:
+        # First run, or a missed day: pull the full history so any
+        # hole in bronze backfills instead of becoming permanent
+        payload = client.get_city_history_cached(state_id, city_id)
+    _record_fetch_date(state_id, city_id, today)
+    return payload
 
 
 def get_fuel_data_for_cities(api_key: str, cities: Optional[List[Dict]] = None) -> List[Dict]:
     """List of API responses"""
-    client = FuelPriceAPI(api_key=api_key)
+    client = get_api_client(api_key)
     cities = cities or DEFAULT_CITIES
-    
+
+    # Fan out one request per city so round-trips overlap instead of
+    # paying full TLS+RTT serially for each city
     results = []
-    for city in cities:
-        try:
-            data = client.get_city_history(city["state_id"], city["city_id"])
-            results.append(data)
-        except Exception as e:
-            print(f"Error fetching {city['city_id']}: {e}")
-            continue
-    
+    with ThreadPoolExecutor(max_workers=len(cities)) as executor:
+        futures = {
+            executor.submit(_fetch_city, client, city["state_id"], city["city_id"]): city
+            for city in cities
+        }
+        for future in as_completed(futures):
+            city = futures[future]
+            try:
+                results.append(future.result())
+            except requests.RequestException as e:
+                # Transient failures are retried in-band by the Session's
+                # Retry policy; getting here means retries are exhausted
+                # (status exhaustion raises RetryError, but connect/read
+                # exhaustion surfaces as ConnectionError/Timeout)
+                request_id = ""
+                if isinstance(e, requests.HTTPError) and e.response is not None:
+                    request_id = e.response.headers.get("x-request-id", "")
+                print(f"Error fetching {city['city_id']} (request_id={request_id}): {e}")
+                continue
+
     return results
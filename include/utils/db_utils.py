@@ -3,10 +3,12 @@ Database Utilities for Fuel Price ETL
 PostgreSQL connection and query helpers
 """
 
+import io
 import os
 import json
+import threading
 import psycopg2
-from psycopg2.extras import execute_values, Json
+from psycopg2.pool import ThreadedConnectionPool
 from typing import List, Dict, Any, Optional
 from contextlib import contextmanager
 
@@ -19,10 +21,29 @@ def get_db_connection_string() -> str:
     )
 
 
+# Process-wide pool so the helper functions reuse warm connections
+# instead of paying the Postgres startup handshake on every call.
+# Created lazily so importing this module never opens a connection.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    minconn=1, maxconn=8, dsn=get_db_connection_string()
+                )
+    return _pool
+
+
 @contextmanager
 def get_connection():
-    """Context manager for database connections"""
-    conn = psycopg2.connect(get_db_connection_string())
+    """Context manager for pooled database connections"""
+    pool = _get_pool()
+    conn = pool.getconn()
     try:
         yield conn
         conn.commit()
@@ -30,53 +51,92 @@ def get_connection():
         conn.rollback()
         raise e
     finally:
-        conn.close()
+        pool.putconn(conn)
 
 
 # =====================
 # BRONZE LAYER OPERATIONS
 # =====================
 
+def _copy_escape(value: Any) -> str:
+    """Escape a value for COPY text format (NULL as \\N)"""
+    if value is None:
+        return r"\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
 def insert_bronze_data(data_list: List[Dict[str, Any]]) -> int:
     """Number of records inserted"""
-    query = """
-        INSERT INTO bronze_fuel_prices 
+    upsert_query = """
+        INSERT INTO bronze_fuel_prices
         (city_id, city_name, state_id, state_name, applicable_on, raw_data)
-        VALUES %s
+        SELECT DISTINCT ON (city_id, applicable_on)
+            city_id, city_name, state_id, state_name, applicable_on, raw_data
+        FROM bronze_stage
+        ORDER BY city_id, applicable_on
         ON CONFLICT (city_id, applicable_on) DO UPDATE SET
             raw_data = EXCLUDED.raw_data,
             ingestion_timestamp = NOW()
     """
-    
-    records = []
+
+    # COPY into the unlogged staging table avoids per-row executor and
+    # WAL overhead; the upsert then happens in a single set-based pass
+    inserted = 0
+    buf = io.StringIO()
     for data in data_list:
         city_id = data.get("cityId")
         city_name = data.get("cityName")
         state_id = data.get("stateId")
         state_name = data.get("stateName")
-        
+
         for history_item in data.get("history", []):
-            records.append((
-                city_id,
-                city_name,
-                state_id,
-                state_name,
-                history_item.get("applicableOn"),
-                Json(history_item)
-            ))
-    
+            inserted += 1
+            buf.write("\t".join((
+                _copy_escape(city_id),
+                _copy_escape(city_name),
+                _copy_escape(state_id),
+                _copy_escape(state_name),
+                _copy_escape(history_item.get("applicableOn")),
+                _copy_escape(json.dumps(history_item)),
+            )) + "\n")
+    buf.seek(0)
+
     with get_connection() as conn:
         with conn.cursor() as cur:
-            execute_values(cur, query, records)
-    
-    return len(records)
+            cur.execute("TRUNCATE bronze_stage")
+            cur.copy_expert(
+                "COPY bronze_stage "
+                "(city_id, city_name, state_id, state_name, applicable_on, raw_data) "
+                "FROM STDIN WITH (FORMAT text)",
+                buf
+            )
+            cur.execute(upsert_query)
+            cur.execute("TRUNCATE bronze_stage")
+
+    return inserted
 
 
 # =====================
 # SILVER LAYER OPERATIONS
 # =====================
 
-def transform_bronze_to_silver() -> int:
+# Restricts the jsonb_each parse to bronze rows ingested since the last
+# silver refresh; re-ingested rows get a fresh ingestion_timestamp, so
+# upserted days are re-parsed while untouched history is skipped
+_BRONZE_WATERMARK_FILTER = """
+          AND ingestion_timestamp > COALESCE(
+              (SELECT MAX(processed_timestamp) FROM silver_fuel_prices),
+              '-infinity'::timestamp
+          )"""
+
+
+def transform_bronze_to_silver(full_refresh: bool = False) -> int:
     """Number of records processed"""
     query = """
         INSERT INTO silver_fuel_prices 
@@ -96,20 +156,24 @@ def transform_bronze_to_silver() -> int:
             fuel.value->>'currency' as currency
         FROM bronze_fuel_prices,
         LATERAL jsonb_each(raw_data->'fuel') as fuel
-        WHERE (raw_data->'fuel') IS NOT NULL
+        WHERE (raw_data->'fuel') IS NOT NULL{watermark}
         ON CONFLICT (city_id, applicable_on, fuel_type) DO UPDATE SET
             retail_price = EXCLUDED.retail_price,
             price_change = EXCLUDED.price_change,
             processed_timestamp = NOW()
-    """
-    
+    """.format(watermark="" if full_refresh else _BRONZE_WATERMARK_FILTER)
+
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(query)
             return cur.rowcount
 
-def aggregate_to_gold_state_analytics() -> int:
-    """Number of records created"""
+def aggregate_to_gold_state_analytics(full_refresh: bool = False) -> int:
+    """Number of records created
+
+    Daily runs only re-aggregate the trailing 2 days (the only rows
+    bronze upserts can touch); pass full_refresh=True for backfills.
+    """
     query = """
         INSERT INTO gold_state_analytics
         (state_id, state_name, report_date, fuel_type, 
@@ -126,6 +190,7 @@ def aggregate_to_gold_state_analytics() -> int:
             COUNT(DISTINCT city_id) as city_count
         FROM silver_fuel_prices
         WHERE retail_price IS NOT NULL
+        {date_filter}
         GROUP BY state_id, applicable_on, fuel_type
         ON CONFLICT (state_id, report_date, fuel_type) DO UPDATE SET
             avg_price = EXCLUDED.avg_price,
@@ -134,8 +199,11 @@ def aggregate_to_gold_state_analytics() -> int:
             price_std_dev = EXCLUDED.price_std_dev,
             city_count = EXCLUDED.city_count,
             computed_timestamp = NOW()
-    """
-    
+    """.format(
+        date_filter="" if full_refresh
+        else "AND applicable_on >= CURRENT_DATE - INTERVAL '2 days'"
+    )
+
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(query)
@@ -150,8 +218,29 @@ def compute_price_trends() -> int:
          trend_start_date, trend_end_date, days_count,
          price_trend_slope, avg_daily_change, total_change,
          start_price, end_price)
-        WITH city_trends AS (
-            SELECT 
+        WITH windowed AS (
+            -- Window endpoints replace the two per-group ARRAY_AGG sorts:
+            -- one pass over the window instead of materializing arrays
+            SELECT
+                city_id,
+                city_name,
+                state_id,
+                fuel_type,
+                applicable_on,
+                retail_price,
+                price_change,
+                FIRST_VALUE(retail_price) OVER w as start_price,
+                LAST_VALUE(retail_price) OVER w as end_price
+            FROM silver_fuel_prices
+            WHERE retail_price IS NOT NULL
+              AND applicable_on >= CURRENT_DATE - INTERVAL '30 days'
+            WINDOW w AS (
+                PARTITION BY city_id, fuel_type ORDER BY applicable_on
+                ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+            )
+        ),
+        city_trends AS (
+            SELECT
                 city_id,
                 MAX(city_name) as city_name,
                 MAX(state_id) as state_id,
@@ -162,24 +251,112 @@ def compute_price_trends() -> int:
                 ROUND(REGR_SLOPE(retail_price, EXTRACT(EPOCH FROM applicable_on))::numeric, 6) as price_trend_slope,
                 ROUND(AVG(price_change), 4) as avg_daily_change,
                 MAX(retail_price) - MIN(retail_price) as total_change,
-                (ARRAY_AGG(retail_price ORDER BY applicable_on ASC))[1] as start_price,
-                (ARRAY_AGG(retail_price ORDER BY applicable_on DESC))[1] as end_price
-            FROM silver_fuel_prices
-            WHERE retail_price IS NOT NULL
-              AND applicable_on >= CURRENT_DATE - INTERVAL '30 days'
+                MIN(start_price) as start_price,
+                MIN(end_price) as end_price
+            FROM windowed
             GROUP BY city_id, fuel_type
             HAVING COUNT(*) >= 5  -- Need at least 5 data points
         )
         SELECT * FROM city_trends
+        ON CONFLICT (city_id, fuel_type) DO UPDATE SET
+            city_name = EXCLUDED.city_name,
+            state_id = EXCLUDED.state_id,
+            trend_start_date = EXCLUDED.trend_start_date,
+            trend_end_date = EXCLUDED.trend_end_date,
+            days_count = EXCLUDED.days_count,
+            price_trend_slope = EXCLUDED.price_trend_slope,
+            avg_daily_change = EXCLUDED.avg_daily_change,
+            total_change = EXCLUDED.total_change,
+            start_price = EXCLUDED.start_price,
+            end_price = EXCLUDED.end_price,
+            computed_timestamp = NOW()
     """
-    
+
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("TRUNCATE gold_price_trends")  # Replace trends daily
             cur.execute(query)
             return cur.rowcount
 
 
+def transform_and_aggregate() -> Dict[str, int]:
+    """Record counts per layer, keyed 'silver' and 'gold'"""
+    # The silver upsert returns the (state, day) keys it touched; the
+    # gold refresh then re-aggregates exactly those groups from the
+    # table, in the same transaction, so each group's stats always
+    # cover its full city set. (Aggregating the RETURNING rowset
+    # directly would overwrite gold with delta-only stats whenever a
+    # state's cities land in different runs.)
+    silver_query = """
+        INSERT INTO silver_fuel_prices
+        (city_id, city_name, state_id, state_name, applicable_on,
+         fuel_type, retail_price, price_change, change_interval, retail_unit, currency)
+        SELECT
+            city_id,
+            city_name,
+            state_id,
+            state_name,
+            applicable_on,
+            fuel.key as fuel_type,
+            (fuel.value->>'retailPrice')::decimal as retail_price,
+            (fuel.value->>'retailPriceChange')::decimal as price_change,
+            fuel.value->>'retailPriceChangeInterval' as change_interval,
+            fuel.value->>'retailUnit' as retail_unit,
+            fuel.value->>'currency' as currency
+        FROM bronze_fuel_prices,
+        LATERAL jsonb_each(raw_data->'fuel') as fuel
+        WHERE (raw_data->'fuel') IS NOT NULL{watermark}
+        ON CONFLICT (city_id, applicable_on, fuel_type) DO UPDATE SET
+            retail_price = EXCLUDED.retail_price,
+            price_change = EXCLUDED.price_change,
+            processed_timestamp = NOW()
+        RETURNING state_id, applicable_on
+    """.format(watermark=_BRONZE_WATERMARK_FILTER)
+
+    state_query = """
+        INSERT INTO gold_state_analytics
+        (state_id, state_name, report_date, fuel_type,
+         avg_price, min_price, max_price, price_std_dev, city_count)
+        SELECT
+            state_id,
+            MAX(state_name) as state_name,
+            applicable_on as report_date,
+            fuel_type,
+            ROUND(AVG(retail_price), 2) as avg_price,
+            MIN(retail_price) as min_price,
+            MAX(retail_price) as max_price,
+            ROUND(STDDEV(retail_price)::numeric, 4) as price_std_dev,
+            COUNT(DISTINCT city_id) as city_count
+        FROM silver_fuel_prices
+        WHERE retail_price IS NOT NULL
+          AND (state_id, applicable_on) IN %s
+        GROUP BY state_id, applicable_on, fuel_type
+        ON CONFLICT (state_id, report_date, fuel_type) DO UPDATE SET
+            avg_price = EXCLUDED.avg_price,
+            min_price = EXCLUDED.min_price,
+            max_price = EXCLUDED.max_price,
+            price_std_dev = EXCLUDED.price_std_dev,
+            city_count = EXCLUDED.city_count,
+            computed_timestamp = NOW()
+    """
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(silver_query)
+            touched = cur.fetchall()
+            silver_rows = len(touched)
+
+            state_rows = 0
+            if touched:
+                cur.execute(state_query, (tuple(set(touched)),))
+                state_rows = cur.rowcount
+
+    # Trends scan the full 30-day silver window, so they run on their
+    # own after the silver/gold refresh commits
+    trend_rows = compute_price_trends()
+
+    return {"silver": silver_rows, "gold": state_rows + trend_rows}
+
+
 def log_etl_run(run_id: str, dag_id: str, task_id: str, layer: str,
                 records_processed: int, records_failed: int = 0,
                 status: str = "success", error_message: str = None):
@@ -201,29 +378,24 @@ def log_etl_run(run_id: str, dag_id: str, task_id: str, layer: str,
 
 def get_analytics_summary() -> Dict[str, Any]:
     """Get summary metrics for MLflow logging"""
+    # Cast to float8/bigint in SQL so psycopg2 hands back native Python
+    # numbers instead of Decimals needing per-row conversion
     query = """
-        SELECT 
+        SELECT
             fuel_type,
-            ROUND(AVG(avg_price), 2) as national_avg,
-            MIN(min_price) as national_min,
-            MAX(max_price) as national_max,
-            SUM(city_count) as total_cities
+            COALESCE(ROUND(AVG(avg_price), 2)::float8, 0) as national_avg,
+            COALESCE(MIN(min_price)::float8, 0) as national_min,
+            COALESCE(MAX(max_price)::float8, 0) as national_max,
+            COALESCE(SUM(city_count)::bigint, 0) as total_cities
         FROM gold_state_analytics
         WHERE report_date = (SELECT MAX(report_date) FROM gold_state_analytics)
         GROUP BY fuel_type
     """
-    
+
     with get_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(query)
+            columns = [desc.name for desc in cur.description]
             rows = cur.fetchall()
-            
-    return {
-        row[0]: {
-            "national_avg": float(row[1]) if row[1] else 0,
-            "national_min": float(row[2]) if row[2] else 0,
-            "national_max": float(row[3]) if row[3] else 0,
-            "total_cities": int(row[4]) if row[4] else 0
-        }
-        for row in rows
-    }
+
+    return {row[0]: dict(zip(columns[1:], row[1:])) for row in rows}
@@ -3,7 +3,17 @@ from typing import Dict, Any, Optional
 import mlflow
 
 
+# Tracking setup is process-wide; remember it so repeated task
+# invocations skip the makedirs/set_tracking_uri/set_experiment work
+_mlflow_configured = False
+
+
 def setup_mlflow(use_local: bool = True):
+    global _mlflow_configured
+
+    if _mlflow_configured:
+        return
+    _mlflow_configured = True
 
     # Always use local by default to avoid costs
     if use_local or not os.getenv("DAGSHUB_TOKEN"):
@@ -21,6 +31,12 @@ def setup_mlflow(use_local: bool = True):
     # Optional: DagsHub remote (only if token is set)
     try:
         import dagshub
+
+        # Keep remote logging snappy: bound each REST call and retry
+        # transient failures instead of hanging the mlflow task
+        os.environ.setdefault("MLFLOW_HTTP_REQUEST_TIMEOUT", "10")
+        os.environ.setdefault("MLFLOW_HTTP_REQUEST_MAX_RETRIES", "3")
+
         owner = os.getenv("DAGSHUB_USER")
         repo = os.getenv("DAGSHUB_REPO", "gas_pipeline_etl")
         dagshub.init(repo_owner=owner, repo_name=repo, mlflow=True)
@@ -33,14 +49,20 @@ def log_etl_metrics(metrics: Dict[str, Any], run_name: str = "fuel_etl_run"):
     # Log ETL pipeline metrics to MLflow
     import mlflow
     
+    # Flatten fuel-specific metrics so they go out in one batched call
+    # instead of one filesystem/HTTP write per metric
+    flat_metrics = {
+        f"{fuel_type}_{metric_name}": value
+        for fuel_type, fuel_metrics in metrics.items()
+        if isinstance(fuel_metrics, dict)
+        for metric_name, value in fuel_metrics.items()
+        if isinstance(value, (int, float))
+    }
+
     with mlflow.start_run(run_name=run_name):
-        # Log fuel-specific metrics
-        for fuel_type, fuel_metrics in metrics.items():
-            if isinstance(fuel_metrics, dict):
-                for metric_name, value in fuel_metrics.items():
-                    if isinstance(value, (int, float)):
-                        mlflow.log_metric(f"{fuel_type}_{metric_name}", value)
-        
+        if flat_metrics:
+            mlflow.log_metrics(flat_metrics)
+
         # Log tags
         mlflow.set_tag("pipeline", "fuel_price_etl")
         mlflow.set_tag("data_source", "rapidapi")